@@ -2,8 +2,15 @@ import paho.mqtt.client as mqtt
 import pandas as pd
 import time
 import configparser
+import logging
+import socket
 import sys
 
+log = logging.getLogger(__name__)
+
+# Emit a progress line every N published messages instead of one per publish
+PUBLISH_LOG_INTERVAL = 1000
+
 def get_mqtt_config():
     """Reads MQTT configuration from the config file."""
     config = configparser.ConfigParser()
@@ -15,48 +22,56 @@ def connect_mqtt(broker, port):
     client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id="network_simulator")
     try:
         client.connect(broker, int(port), 60)
+        # Small log messages shouldn't be held back by Nagle's algorithm
+        client.socket().setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         client.loop_start() # Start a background thread to handle network traffic
-        print(f"✅ Connected to MQTT Broker at {broker}:{port}")
+        log.info("✅ Connected to MQTT Broker at %s:%s", broker, port)
         return client
     except ConnectionRefusedError:
-        print(f"❌ MQTT Connection Error: Connection was refused.")
-        print(f"   Please ensure the Mosquitto container is running ('docker-compose up -d').")
+        log.error("❌ MQTT Connection Error: Connection was refused.")
+        log.error("   Please ensure the Mosquitto container is running ('docker-compose up -d').")
         sys.exit(1)
     except Exception as e:
-        print(f"❌ An unexpected error occurred during MQTT connection: {e}")
+        log.error("❌ An unexpected error occurred during MQTT connection: %s", e)
         sys.exit(1)
 
 def publish_data(client, topic, file_path):
     """Reads data from a CSV and publishes it to an MQTT topic."""
     try:
         df = pd.read_csv(file_path)
-        print(f"\n🚀 Starting network & authentication log simulation...")
-        print(f"   Publishing to topic: '{topic}'")
-        print("   Press Ctrl+C to stop the simulation.")
+        log.info("\n🚀 Starting network & authentication log simulation...")
+        log.info("   Publishing to topic: '%s'", topic)
+        log.info("   Press Ctrl+C to stop the simulation.")
+
+        # The CSV is static, so build every comma-separated payload once up front,
+        # already encoded so paho doesn't re-encode the string on each publish
+        payloads = [payload.encode('utf-8') for payload in df.astype(str).agg(','.join, axis=1)]
         
+        published = 0
         while True:
-            for index, row in df.iterrows():
-                # Convert the row to a comma-separated string payload
-                payload = ','.join(map(str, row.values))
-                result = client.publish(topic, payload)
+            for payload in payloads:
+                result = client.publish(topic, payload, qos=0)
                 
                 if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                    print(f"   -> Published: {payload}")
+                    published += 1
+                    if published % PUBLISH_LOG_INTERVAL == 0:
+                        log.info("   -> Published %d messages so far", published)
                 else:
-                    print(f"   ⚠️ Failed to publish message: {mqtt.error_string(result.rc)}")
+                    log.warning("   ⚠️ Failed to publish message: %s", mqtt.error_string(result.rc))
 
                 time.sleep(3) # Simulate a 3-second interval between logs
                 
     except FileNotFoundError:
-        print(f"❌ Error: The file '{file_path}' was not found.")
+        log.error("❌ Error: The file '%s' was not found.", file_path)
         sys.exit(1)
     except KeyboardInterrupt:
-        print("\n\n🛑 Simulation stopped by user.")
+        log.info("\n\n🛑 Simulation stopped by user.")
     except Exception as e:
-        print(f"❌ An unexpected error occurred: {e}")
+        log.error("❌ An unexpected error occurred: %s", e)
 
 def main():
     """Main function to run the network simulator."""
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     mqtt_config = get_mqtt_config()
     client = connect_mqtt(mqtt_config['BROKER_ADDRESS'], mqtt_config['PORT'])
     
@@ -64,10 +79,10 @@ def main():
         try:
             publish_data(client, mqtt_config['NETWORK_TOPIC'], 'data/raw/auth_network_logs.csv')
         finally:
-            print("   Disconnecting MQTT client...")
+            log.info("   Disconnecting MQTT client...")
             client.loop_stop()
             client.disconnect()
-            print("--- Network Simulator Shut Down ---")
+            log.info("--- Network Simulator Shut Down ---")
 
 if __name__ == '__main__':
     main()
@@ -76,16 +91,18 @@ if __name__ == '__main__':
 
 # 1. Configuration Retrieval: Uses configparser to read the config.ini file, fetching the broker's IP address, port, and the specific NETWORK_TOPIC.
 
-# 2. Secure Connection: Initializes a Paho-MQTT client and attempts to connect to the Mosquitto broker. It uses loop_start() to run a background thread, ensuring the 
-# connection stays alive without blocking the rest of the script.
+# 2. Secure Connection: Initializes a Paho-MQTT client and attempts to connect to the Mosquitto broker, disabling Nagle's algorithm (TCP_NODELAY) on the socket. 
+# It uses loop_start() to run a background thread, ensuring the connection stays alive without blocking the rest of the script.
 
 # 3. Data Ingestion: Loads the auth_network_logs.csv file using the Pandas library, converting the tabular data into a format ready for transmission.
 
-# 4. Continuous Simulation: Enters an infinite while True loop that iterates through every row of the CSV. It converts each row into a comma-separated string (payload) 
-# and publishes it to the broker.
+# 4. Continuous Simulation: Converts every row of the CSV into a comma-separated, UTF-8 encoded payload once, then enters an infinite while True loop that 
+# publishes those precomputed payloads to the broker at QoS 0 (fire-and-forget).
 
 # 5. Interval Control: Implements a 3-second delay (time.sleep(3)) between each message to simulate a steady, realistic flow of network events rather than overwhelming 
 # the system.
 
-# 6. Robust Error Handling: Provides clear console feedback for common issues, such as the Mosquitto container being offline, the CSV file being missing, or the user stopping 
+# 6. Lightweight Logging: Uses the logging module instead of print, reporting only publish failures and a progress line every PUBLISH_LOG_INTERVAL messages.
+
+# 7. Robust Error Handling: Provides clear console feedback for common issues, such as the Mosquitto container being offline, the CSV file being missing, or the user stopping 
 # the script with Ctrl+C.
\ No newline at end of file
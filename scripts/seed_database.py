@@ -1,9 +1,20 @@
 import psycopg2
-import pandas as pd
 import configparser
+import csv
 import os
+import struct
 import sys
 
+# --- BINARY COPY ---
+# Tables with non-text columns are loaded with COPY ... (FORMAT BINARY) so Postgres
+# receives already-typed values; every column not listed here is sent as UTF-8 text.
+BINARY_COLUMN_TYPES = {
+    'staff': {'access_level': 'int4', 'is_on_shift': 'bool'},
+}
+PGCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)  # Signature, flags, extension length
+PGCOPY_TRAILER = struct.pack('!h', -1)
+PGCOPY_NULL = struct.pack('!i', -1)
+
 def get_db_connection():
     """Establishes and returns a connection to the PostgreSQL database."""
     config = configparser.ConfigParser()
@@ -59,12 +70,29 @@ def create_tables(conn):
         );
         """,
         """
+        CREATE INDEX IF NOT EXISTS devices_ip_idx ON devices (ip_address)
+            INCLUDE (device_id, device_type, location, department);
+        """,
+        """
         CREATE TABLE event_logs (
-            event_id SERIAL PRIMARY KEY,
+            event_id BIGSERIAL,
             event_type VARCHAR(50),
-            timestamp TIMESTAMPTZ,
-            event_data JSONB
-        );
+            timestamp TIMESTAMPTZ NOT NULL,
+            event_data JSONB,
+            PRIMARY KEY (event_id, timestamp)
+        ) PARTITION BY RANGE (timestamp);
+        """,
+        # Daily partitions are created on demand by the processor's DatabaseConnector;
+        # the DEFAULT partition catches rows outside their window of days around today.
+        # Indexes declared on the parent are created on every partition.
+        """
+        CREATE TABLE event_logs_default PARTITION OF event_logs DEFAULT;
+        """,
+        """
+        CREATE INDEX event_logs_timestamp_brin ON event_logs USING BRIN (timestamp);
+        """,
+        """
+        CREATE INDEX event_logs_type_timestamp_idx ON event_logs (event_type, timestamp);
         """
     )
     
@@ -73,26 +101,102 @@ def create_tables(conn):
             for command in commands:
                 cur.execute(command)
         conn.commit()
-        print("✅ Tables created successfully (staff, patients, devices, event_logs).")
+        print("✅ Tables and indexes created successfully (staff, patients, devices, event_logs).")
     except (psycopg2.DatabaseError) as e:
         print(f"❌ Error creating tables: {e}")
         conn.rollback()
         raise e
 
+def _encode_text(value):
+    return value.encode('utf-8')
+
+def _encode_int4(value):
+    return struct.pack('!i', int(value))
+
+def _encode_bool(value):
+    """Accepts the same spellings as PostgreSQL's boolean input, so binary COPY rejects what CSV COPY would."""
+    text = value.strip().lower()
+    if text:
+        # Any unique prefix of these words, as PostgreSQL allows
+        for word, flag in (('true', True), ('yes', True), ('false', False), ('no', False)):
+            if word.startswith(text):
+                return b'\x01' if flag else b'\x00'
+        if text in ('on', '1'):
+            return b'\x01'
+        if text in ('of', 'off', '0'):
+            return b'\x00'
+    raise ValueError(f"invalid input syntax for type boolean: {value!r}")
+
+BINARY_ENCODERS = {'int4': _encode_int4, 'bool': _encode_bool}
+
+def copy_csv(cur, table_name, file_path):
+    """Streams a CSV file straight into COPY and returns the number of rows loaded."""
+    with open(file_path, 'rb') as f:
+        # The header row names the columns, so the CSV order doesn't have to match the table
+        columns = f.readline().decode('utf-8').strip()
+        f.seek(0)
+        cur.copy_expert(f"COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT CSV, HEADER)", f)
+    return cur.rowcount
+
+class _ChunkStream:
+    """A read-only file object over an iterator of byte strings, so COPY can pull a large stream chunk by chunk."""
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._pending = b''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._pending) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._pending += chunk
+        if size < 0:
+            size = len(self._pending)
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+def _pgcopy_records(reader, encoders, file_path):
+    """Yields the PGCOPY binary stream for the remaining CSV rows, one record at a time."""
+    field_count = struct.pack('!h', len(encoders))
+    yield PGCOPY_HEADER
+    for row in reader:
+        if len(row) != len(encoders):
+            raise ValueError(f"{file_path} line {reader.line_num}: expected {len(encoders)} fields, got {len(row)}")
+        record = [field_count]
+        for value, encode in zip(row, encoders):
+            if value == '':
+                record.append(PGCOPY_NULL)
+            else:
+                data = encode(value)
+                record.append(struct.pack('!i', len(data)))
+                record.append(data)
+        yield b''.join(record)
+    yield PGCOPY_TRAILER
+
+def copy_binary(cur, table_name, file_path, column_types):
+    """
+    Encodes a CSV file as a PGCOPY binary stream and loads it with COPY (FORMAT BINARY).
+    Rows are encoded as COPY reads them, so memory use doesn't grow with the file.
+    Empty fields become NULLs, matching CSV COPY. Returns the number of rows loaded.
+    """
+    with open(file_path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        columns = next(reader)
+        encoders = [BINARY_ENCODERS.get(column_types.get(col), _encode_text) for col in columns]
+        stream = _ChunkStream(_pgcopy_records(reader, encoders, file_path))
+        cur.copy_expert(f"COPY {table_name} ({','.join(columns)}) FROM STDIN WITH (FORMAT BINARY)", stream)
+    return cur.rowcount
+
 def populate_table(conn, table_name, file_path):
-    """Populates a table from a given CSV file."""
+    """Populates a table from a given CSV file, using binary COPY for typed tables."""
     try:
-        df = pd.read_csv(file_path)
-        buffer = ','.join(df.columns)
-        from io import StringIO
-        sio = StringIO()
-        df.to_csv(sio, index=False, header=False, sep='\t')
-        sio.seek(0)
-
         with conn.cursor() as cur:
-            cur.copy_expert(f"COPY {table_name} ({buffer}) FROM STDIN WITH (FORMAT CSV, DELIMITER E'\\t')", sio)
+            if table_name in BINARY_COLUMN_TYPES:
+                record_count = copy_binary(cur, table_name, file_path, BINARY_COLUMN_TYPES[table_name])
+            else:
+                record_count = copy_csv(cur, table_name, file_path)
         conn.commit()
-        print(f"   -> Successfully populated '{table_name}' with {len(df)} records.")
+        print(f"   -> Successfully populated '{table_name}' with {record_count} records.")
     except (Exception) as e:
         print(f"❌ Error populating table {table_name}: {e}")
         conn.rollback()
@@ -129,9 +233,12 @@ if __name__ == '__main__':
 
 # 1. Connects to PostgreSQL using credentials from a config.ini file.
 
-# 2. Creates three tables: staff, patients, and devices, dropping them first if they exist.
+# 2. Creates three tables: staff, patients, and devices, dropping them first if they exist, plus a covering index on devices(ip_address)
+#    so the enricher's source-IP lookups are index-only scans.
 
-# 3. Populates these tables from CSV files located in data/enrichment/ using efficient bulk insertion.
+# 3. Populates these tables by streaming the CSV files located in data/enrichment/ directly into PostgreSQL's COPY (no pandas round-trip).
+#    Tables with typed columns (staff: access_level, is_on_shift) are encoded client-side, row by row as COPY reads them,
+#    and loaded with binary COPY; a row with the wrong number of fields aborts the load.
 
 # 4. Handles errors gracefully, prints clear messages, and ensures the DB connection is closed at the end.
 
@@ -1,7 +1,16 @@
 from .models import PatientDT, DeviceDT, NetworkDT
+import logging
 import re
 from datetime import datetime
 
+# Compiled once; matches patient IDs embedded in a network event's target resource
+_PAT_RE = re.compile(r'PAT-\d+')
+
+# Shared read-only default for missing nested event sections (never mutated)
+_EMPTY = {}
+
+log = logging.getLogger(__name__)
+
 class HospitalDT:
     """
     The Aggregated Digital Twin (Central Manager).
@@ -11,7 +20,7 @@ class HospitalDT:
         self.patients = {}
         self.devices = {}
         self.networks = {}
-        print("✅ Hospital Digital Twin Manager (Layer 3) initialized.")
+        log.info("✅ Hospital Digital Twin Manager (Layer 3) initialized.")
 
     # --- Helper methods to safely get DTs for Layer 4 ---
     def get_patient_dt(self, patient_id):
@@ -24,59 +33,85 @@ class HospitalDT:
         return self.networks.get(source_ip)
     # --- End new methods ---
 
-    def update_from_event(self, event):
+    def update_from_event(self, event, observer=None):
         """
         Main routing function. Updates the correct individual DT(s)
         based on the incoming enriched event.
+        If given, `observer(label, dt)` is called for every DT that was updated.
         """
-        event_type = event.get('eventType')
-        updated_states = [] 
+        handler = self._DISPATCH.get(event.get('eventType'))
 
-        try:
-            if event_type == 'MedicalDeviceLog':
-                patient_id = event.get('patient', {}).get('id')
-                device_id = event.get('device', {}).get('id')
+        if handler:
+            try:
+                handler(self, event, observer)
+            except Exception as e:
+                log.error("❌ Error during DT state update: %s", e)
 
-                if patient_id:
-                    if patient_id not in self.patients:
-                        self.patients[patient_id] = PatientDT(patient_id)
-                    # This call now updates the patient's status from the event
-                    self.patients[patient_id].update_from_medical_event(event)
-                    updated_states.append(("PatientDT", self.patients[patient_id].get_state()))
-                
-                if device_id:
-                    if device_id not in self.devices:
-                        self.devices[device_id] = DeviceDT(device_id)
-                    self.devices[device_id].update_from_medical_event(event, patient_id)
-                    updated_states.append(("DeviceDT", self.devices[device_id].get_state()))
+    def update_and_snapshot(self, event):
+        """Same as update_from_event, but returns a (label, state) snapshot for every DT updated."""
+        updated_states = []
+        self.update_from_event(event, lambda label, dt: updated_states.append((label, dt.get_state())))
+        return updated_states
 
-            elif event_type == 'NetworkAuthLog':
-                source_ip = event.get('network', {}).get('source_ip')
-                
-                if source_ip:
-                    if source_ip not in self.networks:
-                        self.networks[source_ip] = NetworkDT(source_ip)
-                    self.networks[source_ip].update_from_network_event(event) 
-                    updated_states.append(("NetworkDT", self.networks[source_ip].get_state()))
-                
-                device_id = event.get('network', {}).get('source_device_details', {}).get('device_id')
-                if device_id:
-                    if device_id not in self.devices:
-                        self.devices[device_id] = DeviceDT(device_id)
-                    self.devices[device_id].update_from_network_event(event)
-                    updated_states.append(("DeviceDT", self.devices[device_id].get_state()))
-                
-                target_resource = event.get('action', {}).get('target_resource_id', '')
-                patient_id_match = re.search(r'(PAT-\d+)', target_resource)
-                if patient_id_match:
-                    patient_id = patient_id_match.group(1)
-                    if patient_id not in self.patients:
-                        self.patients[patient_id] = PatientDT(patient_id)
-                    # This call now updates the patient's status from the event
-                    self.patients[patient_id].update_from_network_event(event)
-                    updated_states.append(("PatientDT", self.patients[patient_id].get_state()))
+    def _update_from_medical_event(self, event, observer):
+        """Routes a MedicalDeviceLog event to its patient and device DTs."""
+        patient_id = (event.get('patient') or _EMPTY).get('id')
+        device_id = (event.get('device') or _EMPTY).get('id')
+
+        if patient_id:
+            patient_dt = self.patients.get(patient_id)
+            if patient_dt is None:
+                patient_dt = self.patients[patient_id] = PatientDT(patient_id)
+            # This call now updates the patient's status from the event
+            patient_dt.update_from_medical_event(event)
+            if observer is not None:
+                observer("PatientDT", patient_dt)
         
-        except Exception as e:
-            print(f"❌ Error during DT state update: {e}")
-            
-        return updated_states
\ No newline at end of file
+        if device_id:
+            device_dt = self.devices.get(device_id)
+            if device_dt is None:
+                device_dt = self.devices[device_id] = DeviceDT(device_id)
+            device_dt.update_from_medical_event(event, patient_id)
+            if observer is not None:
+                observer("DeviceDT", device_dt)
+
+    def _update_from_network_event(self, event, observer):
+        """Routes a NetworkAuthLog event to its network, device and patient DTs."""
+        network = event.get('network') or _EMPTY
+        source_ip = network.get('source_ip')
+        
+        if source_ip:
+            network_dt = self.networks.get(source_ip)
+            if network_dt is None:
+                network_dt = self.networks[source_ip] = NetworkDT(source_ip)
+            network_dt.update_from_network_event(event) 
+            if observer is not None:
+                observer("NetworkDT", network_dt)
+        
+        device_id = (network.get('source_device_details') or _EMPTY).get('device_id')
+        if device_id:
+            device_dt = self.devices.get(device_id)
+            if device_dt is None:
+                device_dt = self.devices[device_id] = DeviceDT(device_id)
+            device_dt.update_from_network_event(event)
+            if observer is not None:
+                observer("DeviceDT", device_dt)
+        
+        target_resource = (event.get('action') or _EMPTY).get('target_resource_id') or ''
+        # Cheap substring check first; most target resources are not patients
+        patient_id_match = _PAT_RE.search(target_resource) if 'PAT-' in target_resource else None
+        if patient_id_match:
+            patient_id = patient_id_match.group(0)
+            patient_dt = self.patients.get(patient_id)
+            if patient_dt is None:
+                patient_dt = self.patients[patient_id] = PatientDT(patient_id)
+            # This call now updates the patient's status from the event
+            patient_dt.update_from_network_event(event)
+            if observer is not None:
+                observer("PatientDT", patient_dt)
+
+    # eventType -> update handler; unknown event types update nothing
+    _DISPATCH = {
+        'MedicalDeviceLog': _update_from_medical_event,
+        'NetworkAuthLog': _update_from_network_event,
+    }
\ No newline at end of file
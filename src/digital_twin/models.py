@@ -1,4 +1,5 @@
-from collections import deque
+import sys
+from collections import deque, namedtuple
 from datetime import datetime, timedelta
 
 # --- STATISTICAL BASELINE CONSTANTS ---
@@ -7,8 +8,29 @@ STATS_WINDOW_MINUTES = 5
 SHORT_TERM_MEMORY = 5
 IP_ACCESS_RATE_MINUTES = 1
 
+def _intern(value):
+    """
+    Interns categorical strings (statuses, rooms, action types) so every twin shares one
+    copy and equality checks against the rule constants hit the identity fast path.
+    """
+    return sys.intern(value) if type(value) is str else value
+
+def _snapshot(dt):
+    """Builds dt.State from dt's slots, copying deques/sets into lists so the snapshot is detached."""
+    return dt.State._make(
+        list(value) if isinstance(value, (deque, set)) else value
+        for value in (getattr(dt, field) for field in dt.__slots__)
+    )
+
 class PatientDT:
     """Represents the 'living profile' of a single patient."""
+    __slots__ = (
+        'patient_id', 'full_name', 'current_room', 'status',
+        'last_heart_rate', 'last_spo2', 'last_device_status', 'last_metric_update', 'last_5_heart_rates',
+        'last_accessed_by_user_id', 'last_access_action', 'last_access_time',
+    )
+    State = namedtuple('PatientState', __slots__)
+
     def __init__(self, patient_id):
         self.patient_id = patient_id
         self.full_name = None
@@ -32,14 +54,14 @@ class PatientDT:
         # Now updates status from the enriched event
         if 'patient' in event:
             self.full_name = event['patient'].get('full_name', self.full_name)
-            self.current_room = event['patient'].get('current_room', self.current_room)
-            self.status = event['patient'].get('status', self.status) # <-- UPDATED
+            self.current_room = _intern(event['patient'].get('current_room', self.current_room))
+            self.status = _intern(event['patient'].get('status', self.status)) # <-- UPDATED
         
         if 'device' in event and 'metrics' in event['device']:
             metrics = event['device']['metrics']
             self.last_heart_rate = metrics.get('heart_rate_bpm', self.last_heart_rate)
             self.last_spo2 = metrics.get('spo2_percent', self.last_spo2)
-            self.last_device_status = event['device'].get('status', self.last_device_status)
+            self.last_device_status = _intern(event['device'].get('status', self.last_device_status))
             
             if self.last_heart_rate is not None:
                 self.last_5_heart_rates.append(self.last_heart_rate)
@@ -50,22 +72,27 @@ class PatientDT:
         if 'user' in event:
             self.last_accessed_by_user_id = event['user'].get('id', self.last_accessed_by_user_id)
         if 'action' in event:
-            self.last_access_action = event['action'].get('type', self.last_access_action)
+            self.last_access_action = _intern(event['action'].get('type', self.last_access_action))
             
         # If the enricher added patient details, update the DT
         if 'target_patient_details' in event:
             self.full_name = event['target_patient_details'].get('full_name', self.full_name)
-            self.current_room = event['target_patient_details'].get('current_room', self.current_room)
-            self.status = event['target_patient_details'].get('status', self.status)
+            self.current_room = _intern(event['target_patient_details'].get('current_room', self.current_room))
+            self.status = _intern(event['target_patient_details'].get('status', self.status))
 
     def get_state(self):
-        """Returns the current state as a dictionary."""
-        state = self.__dict__.copy()
-        state['last_5_heart_rates'] = list(self.last_5_heart_rates)
-        return state
+        """Returns an immutable snapshot of the current state."""
+        return _snapshot(self)
 
 class DeviceDT:
     """Represents the 'living profile' of a single device."""
+    __slots__ = (
+        'device_id', 'device_type', 'location', 'department', 'ip_address',
+        'status', 'current_patient_id', 'last_metric_update', 'last_heart_rate',
+        'last_user_id', 'last_action_from_device', 'last_network_update',
+    )
+    State = namedtuple('DeviceState', __slots__)
+
     def __init__(self, device_id):
         self.device_id = device_id
         self.device_type = None
@@ -88,11 +115,11 @@ class DeviceDT:
         self.current_patient_id = patient_id
         
         if 'device' in event:
-            self.device_type = event['device'].get('device_type', self.device_type)
-            self.location = event['device'].get('location', self.location)
-            self.department = event['device'].get('department', self.department)
+            self.device_type = _intern(event['device'].get('device_type', self.device_type))
+            self.location = _intern(event['device'].get('location', self.location))
+            self.department = _intern(event['device'].get('department', self.department))
             self.ip_address = event['device'].get('ip_address', self.ip_address)
-            self.status = event['device'].get('status', self.status)
+            self.status = _intern(event['device'].get('status', self.status))
 
         if 'metrics' in event.get('device', {}):
             self.last_heart_rate = event['device']['metrics'].get('heart_rate_bpm', self.last_heart_rate)
@@ -103,17 +130,24 @@ class DeviceDT:
         if 'user' in event:
             self.last_user_id = event['user'].get('id', self.last_user_id)
         if 'action' in event:
-            self.last_action_from_device = event['action'].get('type', self.last_action_from_device)
+            self.last_action_from_device = _intern(event['action'].get('type', self.last_action_from_device))
         if 'network' in event and 'source_device_details' in event['network']:
              details = event['network']['source_device_details']
-             self.device_type = details.get('device_type', self.device_type)
-             self.location = details.get('location', self.location)
+             self.device_type = _intern(details.get('device_type', self.device_type))
+             self.location = _intern(details.get('location', self.location))
 
     def get_state(self):
-        return self.__dict__
+        """Returns an immutable snapshot of the current state."""
+        return _snapshot(self)
 
 class NetworkDT:
     """Represents the 'living profile' of a network source (IP address)."""
+    __slots__ = (
+        'source_ip', 'last_update',
+        'failed_login_count', 'event_timestamps', 'known_users_set', 'user_history_5min', 'common_actions_set',
+    )
+    State = namedtuple('NetworkState', __slots__)
+
     def __init__(self, source_ip):
         self.source_ip = source_ip
         self.last_update = None
@@ -134,7 +168,7 @@ class NetworkDT:
         except (ValueError, TypeError):
             event_time = datetime.now() # Fallback
 
-        action_type = event.get('action', {}).get('type')
+        action_type = _intern(event.get('action', {}).get('type'))
         user_id = event.get('user', {}).get('id')
 
         if action_type == 'login_failure':
@@ -182,10 +216,5 @@ class NetworkDT:
         return count
 
     def get_state(self):
-        """Returns the current state as a dictionary."""
-        state = self.__dict__.copy()
-        state['event_timestamps'] = list(self.event_timestamps)
-        state['known_users_set'] = list(self.known_users_set)
-        state['user_history_5min'] = list(self.user_history_5min)
-        state['common_actions_set'] = list(self.common_actions_set)
-        return state
\ No newline at end of file
+        """Returns an immutable snapshot of the current state."""
+        return _snapshot(self)
\ No newline at end of file
@@ -1,4 +1,7 @@
 # File: src/pre_detection/contextualizer.py
+import logging
+
+log = logging.getLogger(__name__)
 
 class ConsistencyChecker:
     """
@@ -12,7 +15,7 @@ class ConsistencyChecker:
     ROLES_TECH = {'IT_Admin', 'Biomed_Engineer'}
     
     def __init__(self):
-        print("✅ Layer 4 (Contextualizer) initialized.")
+        log.info("✅ Layer 4 (Contextualizer) initialized.")
         self.check_map = self._get_check_map()
 
     def filter_anomalies(self, anomalies, event, dt_manager):
@@ -1,3 +1,4 @@
+import logging
 from datetime import datetime, timedelta
 
 # --- STATISTICAL THRESHOLDS ---
@@ -13,13 +14,15 @@ STUCK_DATA_COUNT = 4       # B9
 VOLATILITY_HR_JUMP = 50    # B10
 DEVICE_INTERVAL_SECS = 300 # B11: 5 minutes
 
+log = logging.getLogger(__name__)
+
 class AnomalyDetector:
     """
     Implements Layer 4 (Stage 1): Anomaly Detection.
     Checks an event against all 22 defined rules.
     """
     def __init__(self):
-        print("✅ Layer 4 (Detector) initialized.")
+        log.info("✅ Layer 4 (Detector) initialized.")
         self.rules = self._get_all_rules()
 
     def check_event(self, event, dt_manager):
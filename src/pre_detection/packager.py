@@ -1,20 +1,24 @@
-import json
+import logging
 import uuid
 
+from src.utils import json_utils
+
+log = logging.getLogger(__name__)
+
 class PackageCreator:
     """
     Implements Layer 4 (Stage 3): Package Creation.
     Builds the "Contextual Anomaly Package" for Layer 5 (LLM).
     """
     def __init__(self):
-        print("✅ Layer 4 (Packager) initialized.")
+        log.info("✅ Layer 4 (Packager) initialized.")
 
     def build_case_file(self, suspicious_anomalies, event, dt_manager):
         """
         Assembles all relevant information into a single JSON "case file".
         """
         case_id = f"CASE-{uuid.uuid4()}"
-        print(f"   -> L4 (Package) 📦 Building case file: {case_id}")
+        log.info("   -> L4 (Package) 📦 Building case file: %s", case_id)
         
         involved_entities = self._get_involved_entities(event, dt_manager)
         
@@ -30,7 +34,7 @@ class PackageCreator:
             "contextual_profiles": involved_entities
         }
         
-        return json.dumps(case_file, indent=2, default=str)
+        return json_utils.dumps(case_file, indent=True)
 
     def _get_involved_entities(self, event, dt):
         """Gathers the DT states for all entities in the event."""
@@ -46,7 +50,7 @@ class PackageCreator:
         
         if patient_id:
             p_dt = dt.get_patient_dt(patient_id)
-            if p_dt: entities['patient'] = p_dt.get_state()
+            if p_dt: entities['patient'] = p_dt.get_state()._asdict()
 
         device_id = event.get('device', {}).get('id')
         if not device_id:
@@ -54,12 +58,12 @@ class PackageCreator:
 
         if device_id:
             d_dt = dt.get_device_dt(device_id)
-            if d_dt: entities['device'] = d_dt.get_state()
+            if d_dt: entities['device'] = d_dt.get_state()._asdict()
             
         ip = event.get('network', {}).get('source_ip')
         if ip:
             n_dt = dt.get_network_dt(ip)
-            if n_dt: entities['network_ip'] = n_dt.get_state()
+            if n_dt: entities['network_ip'] = n_dt.get_state()._asdict()
             
         return entities
 
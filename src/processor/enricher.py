@@ -1,112 +1,254 @@
-import json
+import logging
 
-def process_device_message(payload, db_connector):
-    """
-    Parses, standardizes, and enriches a raw medical device log message.
-    """
+from src.utils.cache import TTLCache
+
+log = logging.getLogger(__name__)
+
+DEVICE_EVENT = "MedicalDeviceLog"
+NETWORK_EVENT = "NetworkAuthLog"
+
+# --- Columns merged into each part of the enriched event ---
+DEVICE_FIELDS = ('device_type', 'location', 'department', 'ip_address')
+SOURCE_DEVICE_FIELDS = ('device_id', 'device_type', 'location', 'department')
+PATIENT_FIELDS = ('full_name', 'current_room', 'assigned_doctor_id', 'status')
+TARGET_PATIENT_FIELDS = ('full_name', 'current_room', 'status')
+USER_FIELDS = ('full_name', 'role', 'department', 'access_level', 'is_on_shift')
+DOCTOR_FIELDS = ('full_name', 'role', 'is_on_shift')
+
+# --- REFERENCE-DATA CACHE ---
+# staff, patients and devices change rarely, so rows (and misses) are cached per key
+CACHE_MAX_ENTRIES = 4096
+CACHE_TTL_SECS = 300  # Bounds how stale a row can get after the tables are reseeded
+
+_device_cache = TTLCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECS)
+_device_ip_cache = TTLCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECS)
+_patient_cache = TTLCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECS)
+_staff_cache = TTLCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECS)
+
+_MISSING = object()
+
+
+def invalidate():
+    """Drops every cached reference row, e.g. after the enrichment tables are reloaded."""
+    for cache in (_device_cache, _device_ip_cache, _patient_cache, _staff_cache):
+        cache.clear()
+
+
+def _from_cache(cache, keys):
+    """Splits `keys` into a {key: row} dict of cached rows and a list of keys to fetch."""
+    found, missing = {}, []
+    for key in keys:
+        row = cache.get(key, _MISSING)
+        if row is _MISSING:
+            missing.append(key)
+        else:
+            found[key] = row
+    return found, missing
+
+
+def _fill_cache(cache, found, keys, rows, key_column):
+    """Caches the fetched rows for `keys` (None for keys with no row) and adds them to `found`."""
+    if rows is None:
+        return  # Query failed; don't cache the misses
+    by_key = {row[key_column]: row for row in rows}
+    for key in keys:
+        row = by_key.get(key)
+        cache.set(key, row)
+        found[key] = row
+
+
+def _decode(payload):
+    """Decodes a raw MQTT payload (str passes through); returns None if it is not valid UTF-8."""
+    if isinstance(payload, str):
+        return payload
     try:
-        parts = payload.split(',')
-        if len(parts) != 6:
-            print(f"⚠️ Malformed device message received: {payload}")
-            return None
-        
-        timestamp, device_id, patient_id, heart_rate, spo2, status = parts
-        
-        base_event = {
-            "eventType": "MedicalDeviceLog",
-            "timestamp": timestamp,
-            "raw_payload": payload,
-            "device": {
-                "id": device_id,
-                "status": status,
-                "metrics": {
-                    "heart_rate_bpm": int(heart_rate),
-                    "spo2_percent": int(spo2)
-                }
-            },
-            "patient": {
-                "id": patient_id
+        return payload.decode('utf-8')
+    except UnicodeDecodeError:
+        log.warning("⚠️ Undecodable message received: %r", payload)
+        return None
+
+
+def _parse_device_payload(payload):
+    """Parses and standardizes a raw medical device log message."""
+    # Every message has exactly 6 fields; reject anything else before splitting
+    if payload.count(',') != 5:
+        log.warning("⚠️ Malformed device message received: %s", payload)
+        return None
+
+    timestamp, device_id, patient_id, heart_rate, spo2, status = payload.split(',', 5)
+
+    # Validate the vitals up front instead of letting int() raise on garbage
+    if not (heart_rate.isdecimal() and spo2.isdecimal()):
+        log.warning("❌ Error parsing device message payload '%s': non-numeric vitals", payload)
+        return None
+
+    return {
+        "eventType": DEVICE_EVENT,
+        "timestamp": timestamp,
+        "raw_payload": payload,
+        "device": {
+            "id": device_id,
+            "status": status,
+            "metrics": {
+                "heart_rate_bpm": int(heart_rate),
+                "spo2_percent": int(spo2)
             }
+        },
+        "patient": {
+            "id": patient_id
         }
-        
-        device_info = db_connector.fetch_one_as_dict(
-            "SELECT device_type, location, department, ip_address FROM devices WHERE device_id = %s", (device_id,)
-        )
-        if device_info:
-            base_event['device'].update(device_info)
-            
-        # Now fetches the 'status' column from the database
-        patient_info = db_connector.fetch_one_as_dict(
-            "SELECT full_name, current_room, assigned_doctor_id, status FROM patients WHERE patient_id = %s", (patient_id,)
-        )
-        if patient_info:
-            base_event['patient'].update(patient_info)
-            if patient_info.get('assigned_doctor_id'):
-                doctor_info = db_connector.fetch_one_as_dict(
-                   "SELECT full_name, role, is_on_shift FROM staff WHERE user_id = %s", (patient_info['assigned_doctor_id'],)
-                )
-                if doctor_info:
-                    base_event['patient']['assigned_doctor_details'] = doctor_info
-        
-        return base_event
-        
-    except (ValueError, IndexError) as e:
-        print(f"❌ Error parsing device message payload '{payload}': {e}")
+    }
+
+
+def _parse_network_payload(payload):
+    """Parses and standardizes a raw network/auth log message."""
+    # Every message has exactly 6 fields; reject anything else before splitting
+    if payload.count(',') != 5:
+        log.warning("⚠️ Malformed network message received: %s", payload)
         return None
 
+    timestamp, log_source, user_id, source_ip, action, target_resource = payload.split(',', 5)
 
-def process_network_message(payload, db_connector):
+    return {
+        "eventType": NETWORK_EVENT,
+        "timestamp": timestamp,
+        "raw_payload": payload,
+        "network": {
+            "source_ip": source_ip,
+            "log_source": log_source
+        },
+        "action": {
+            "type": action,
+            "target_resource_id": target_resource
+        },
+        "user": {
+            "id": user_id
+        }
+    }
+
+
+_PARSERS = {
+    DEVICE_EVENT: _parse_device_payload,
+    NETWORK_EVENT: _parse_network_payload,
+}
+
+
+def _pick(row, fields):
+    """Projects a database row onto the given columns."""
+    return {field: row[field] for field in fields}
+
+
+def _enrich_device_event(event, devices, patients, staff):
+    """Merges the looked-up reference rows into a MedicalDeviceLog event."""
+    device_info = devices.get(event['device']['id'])
+    if device_info:
+        event['device'].update(_pick(device_info, DEVICE_FIELDS))
+
+    patient_info = patients.get(event['patient']['id'])
+    if patient_info:
+        event['patient'].update(_pick(patient_info, PATIENT_FIELDS))
+        doctor_info = staff.get(patient_info.get('assigned_doctor_id'))
+        if doctor_info:
+            event['patient']['assigned_doctor_details'] = _pick(doctor_info, DOCTOR_FIELDS)
+
+
+def _enrich_network_event(event, devices_by_ip, patients, staff):
+    """Merges the looked-up reference rows into a NetworkAuthLog event."""
+    user_info = staff.get(event['user']['id'])
+    if user_info:
+        event['user'].update(_pick(user_info, USER_FIELDS))
+
+    device_info = devices_by_ip.get(event['network']['source_ip'])
+    if device_info:
+        event['network']['source_device_details'] = _pick(device_info, SOURCE_DEVICE_FIELDS)
+
+    # If the target resource is a patient, enrich it with their info
+    patient_info = patients.get(event['action']['target_resource_id'])
+    if patient_info:
+        event['target_patient_details'] = _pick(patient_info, TARGET_PATIENT_FIELDS)
+
+
+def process_batch(messages, db_connector):
     """
-    Parses, standardizes, and enriches a raw network/auth log message.
+    Parses and enriches a batch of raw messages with one query per reference table.
+    `messages` is a list of (event_type, payload) tuples, where payload is the
+    raw MQTT bytes (or an already decoded str); returns the enriched events in
+    arrival order, skipping any that could not be decoded or parsed.
     """
-    try:
-        parts = payload.split(',')
-        if len(parts) != 6:
-            print(f"⚠️ Malformed network message received: {payload}")
-            return None
-            
-        timestamp, log_source, user_id, source_ip, action, target_resource = parts
-        
-        base_event = {
-            "eventType": "NetworkAuthLog",
-            "timestamp": timestamp,
-            "raw_payload": payload,
-            "network": {
-                "source_ip": source_ip,
-                "log_source": log_source
-            },
-            "action": {
-                "type": action,
-                "target_resource_id": target_resource
-            },
-            "user": {
-                "id": user_id
-            }
-        }
-        
-        user_info = db_connector.fetch_one_as_dict(
-            "SELECT full_name, role, department, access_level, is_on_shift FROM staff WHERE user_id = %s", (user_id,)
+    events = []
+    for event_type, payload in messages:
+        payload = _decode(payload)
+        if payload is None:
+            continue
+        event = _PARSERS[event_type](payload)
+        if event:
+            events.append(event)
+
+    if not events:
+        return events
+
+    # Collect every distinct key referenced by the batch
+    device_ids, source_ips, patient_ids, user_ids = set(), set(), set(), set()
+    for event in events:
+        if event['eventType'] == DEVICE_EVENT:
+            device_ids.add(event['device']['id'])
+            patient_ids.add(event['patient']['id'])
+        else:
+            source_ips.add(event['network']['source_ip'])
+            user_ids.add(event['user']['id'])
+            target_resource = event['action']['target_resource_id']
+            if target_resource.startswith('PAT-'):
+                patient_ids.add(target_resource)
+
+    # Only keys that are not already cached go to the database
+    devices, missing_device_ids = _from_cache(_device_cache, device_ids)
+    devices_by_ip, missing_ips = _from_cache(_device_ip_cache, source_ips)
+    if missing_device_ids or missing_ips:
+        rows = db_connector.fetch_all_as_dict(
+            "SELECT device_id, device_type, location, department, ip_address FROM devices "
+            "WHERE device_id = ANY(%s) OR ip_address = ANY(%s)", (missing_device_ids, missing_ips)
+        )
+        _fill_cache(_device_cache, devices, missing_device_ids, rows, 'device_id')
+        _fill_cache(_device_ip_cache, devices_by_ip, missing_ips, rows, 'ip_address')
+
+    patients, missing_patient_ids = _from_cache(_patient_cache, patient_ids)
+    if missing_patient_ids:
+        rows = db_connector.fetch_all_as_dict(
+            "SELECT patient_id, full_name, current_room, assigned_doctor_id, status FROM patients "
+            "WHERE patient_id = ANY(%s)", (missing_patient_ids,)
         )
-        if user_info:
-            base_event['user'].update(user_info)
+        _fill_cache(_patient_cache, patients, missing_patient_ids, rows, 'patient_id')
 
-        device_info = db_connector.fetch_one_as_dict(
-            "SELECT device_id, device_type, location, department FROM devices WHERE ip_address = %s", (source_ip,)
+    # Assigned doctors are only known once the patients have been fetched
+    user_ids.update(row['assigned_doctor_id'] for row in patients.values() if row and row['assigned_doctor_id'])
+    staff, missing_user_ids = _from_cache(_staff_cache, user_ids)
+    if missing_user_ids:
+        rows = db_connector.fetch_all_as_dict(
+            "SELECT user_id, full_name, role, department, access_level, is_on_shift FROM staff "
+            "WHERE user_id = ANY(%s)", (missing_user_ids,)
         )
-        if device_info:
-            base_event['network']['source_device_details'] = device_info
-            
-        # If the target resource is a patient, enrich it with their info
-        if target_resource.startswith('PAT-'):
-            patient_info = db_connector.fetch_one_as_dict(
-                "SELECT full_name, current_room, status FROM patients WHERE patient_id = %s", (target_resource,)
-            )
-            if patient_info:
-                # Add this info to a new key
-                base_event['target_patient_details'] = patient_info
-            
-        return base_event
-
-    except (ValueError, IndexError) as e:
-        print(f"❌ Error parsing network message payload '{payload}': {e}")
-        return None
\ No newline at end of file
+        _fill_cache(_staff_cache, staff, missing_user_ids, rows, 'user_id')
+
+    for event in events:
+        if event['eventType'] == DEVICE_EVENT:
+            _enrich_device_event(event, devices, patients, staff)
+        else:
+            _enrich_network_event(event, devices_by_ip, patients, staff)
+
+    return events
+
+
+def process_device_message(payload, db_connector):
+    """
+    Parses, standardizes, and enriches a raw medical device log message.
+    """
+    events = process_batch([(DEVICE_EVENT, payload)], db_connector)
+    return events[0] if events else None
+
+
+def process_network_message(payload, db_connector):
+    """
+    Parses, standardizes, and enriches a raw network/auth log message.
+    """
+    events = process_batch([(NETWORK_EVENT, payload)], db_connector)
+    return events[0] if events else None
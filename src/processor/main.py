@@ -1,15 +1,17 @@
 import paho.mqtt.client as mqtt
-import configparser
-import json
-import sys
+import atexit
+import logging
+import logging.handlers
+import queue
+import socket
 import os
-
-# --- Adjust path to import from root ---
-PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-sys.path.append(PROJECT_ROOT)
-# --- End Path Adjust ---
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from src.utils.db_connector import DatabaseConnector
+from src.utils import json_utils, metrics
+from src.utils.config import load_config
 from src.processor import enricher
 from src.digital_twin.manager import HospitalDT
 
@@ -18,51 +20,203 @@ from src.pre_detection.detector import AnomalyDetector
 from src.pre_detection.contextualizer import ConsistencyChecker
 from src.pre_detection.packager import PackageCreator
 
+log = logging.getLogger(__name__)
+
+# Update counters per DT type, bound once instead of looked up by label per update
+DT_UPDATE_COUNTERS = {label: metrics.DT_UPDATES.labels(label) for label in ('PatientDT', 'DeviceDT', 'NetworkDT')}
+
+# --- L2 BATCHING PARAMETERS ---
+BATCH_MAX_SIZE = 64         # Enrich at most 64 messages per batch
+BATCH_MAX_WAIT_SECS = 0.05  # ...or whatever arrived within 50 ms
+ENRICH_WORKERS = 8          # Batches enriched concurrently (each holds one DB connection)
+EVENT_FLUSH_IDLE_SECS = 0.5 # Flush buffered event_logs rows after this long without new batches
+INGEST_QUEUE_MAX = 10_000   # Messages held for the batch worker before new ones are dropped
+DROP_LOG_INTERVAL = 1000    # Warn once per this many dropped messages
+
+def parse_cpu_list(spec):
+    """Parses a CPU list such as "0-3,8" into a set of CPU numbers."""
+    cpus = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+def pin_to_cpus(spec):
+    """Restricts this process to the CPUs in `spec` (e.g. the NIC's NUMA node); a blank spec does nothing."""
+    cpus = parse_cpu_list(spec)
+    if not cpus:
+        return
+    if not hasattr(os, 'sched_setaffinity'):
+        log.warning("⚠️ CPU_AFFINITY is set but this platform can't pin processes; ignoring it.")
+        return
+    os.sched_setaffinity(0, cpus)
+    log.info("📌 Pinned to CPUs %s", sorted(cpus))
+
+def configure_logging(level_name):
+    """
+    Routes every log record through a queue. QueueHandler still formats each record
+    on the calling thread; a QueueListener thread does the writes to stderr.
+    """
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    listener = logging.handlers.QueueListener(log_queue, handler)
+
+    root = logging.getLogger()
+    root.setLevel(level_name.upper())
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    listener.start()
+    # Stopping the listener drains what is still queued, even on sys.exit()
+    atexit.register(listener.stop)
+
 def on_connect(client, userdata, flags, reason_code, properties):
     """Callback function for when the client connects to the MQTT broker."""
     if reason_code == 0:
-        print("✅ Successfully connected to MQTT Broker!")
-        client.subscribe(userdata['device_topic'])
-        client.subscribe(userdata['network_topic'])
-        print(f"   -> Subscribed to topic: {userdata['device_topic']}")
-        print(f"   -> Subscribed to topic: {userdata['network_topic']}")
+        log.info("✅ Successfully connected to MQTT Broker!")
+        # Set on every (re)connect, since paho opens a new socket each time
+        client.socket().setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # Telemetry is fire-and-forget, so QoS 0 avoids per-message acknowledgements
+        client.subscribe(userdata['device_topic'], qos=0)
+        client.subscribe(userdata['network_topic'], qos=0)
+        log.info("   -> Subscribed to topic: %s", userdata['device_topic'])
+        log.info("   -> Subscribed to topic: %s", userdata['network_topic'])
     else:
-        print(f"❌ Failed to connect to MQTT, return code {reason_code}\n")
-        sys.exit(1)
+        log.error("❌ Failed to connect to MQTT, return code %s\n", reason_code)
+        userdata['stop_event'].set()
 
-def on_message(client, userdata, msg):
-    """Callback function for when a message is received from the broker."""
-    payload = msg.payload.decode('utf-8')
-    print(f"\n📩 Message received on topic '{msg.topic}'")
-    
+def make_message_callback(event_type, ingest_queue):
+    """
+    Builds the paho callback for one topic. paho routes messages to it through its
+    subscription matcher, and the event type is bound here once instead of comparing topics.
+    The callback only queues the payload so paho's network thread is never blocked by the
+    database; enrichment and detection run on the worker threads. If the workers fall too
+    far behind, the message is dropped (and counted) rather than stalling the network thread.
+    """
+    received = metrics.MESSAGES_RECEIVED.labels(event_type)
+
+    def on_topic_message(client, userdata, msg):
+        received.inc()
+        log.debug("\n📩 Message received on topic '%s'", msg.topic)
+        try:
+            # Raw bytes: decoding happens on the enrichment threads, and never for dropped messages
+            ingest_queue.put_nowait((event_type, msg.payload))
+        except queue.Full:
+            record_dropped_message(userdata)
+    return on_topic_message
+
+def record_dropped_message(userdata):
+    """Counts a message dropped because the ingest queue was full, warning every DROP_LOG_INTERVAL drops."""
+    userdata['dropped_messages'] += 1
+    metrics.MESSAGES_DROPPED.inc()
+    if userdata['dropped_messages'] % DROP_LOG_INTERVAL == 1:
+        log.warning("⚠️ Ingest queue full, %d message(s) dropped so far", userdata['dropped_messages'])
+
+def batch_worker(userdata):
+    """
+    Drains the ingest queue in batches of up to BATCH_MAX_SIZE messages (or
+    whatever arrived within BATCH_MAX_WAIT_SECS) and submits each batch to the
+    enrichment pool. The pending results are queued in arrival order for the
+    event worker. A None item stops the worker once the current batch is submitted.
+    """
+    ingest_queue = userdata['ingest_queue']
+    enriched_queue = userdata['enriched_queue']
+    executor = userdata['executor']
+    running = True
+
+    while running:
+        item = ingest_queue.get()
+        if item is None:
+            break
+
+        batch = [item]
+        deadline = time.monotonic() + BATCH_MAX_WAIT_SECS
+        while len(batch) < BATCH_MAX_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = ingest_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                running = False
+                break
+            batch.append(item)
+
+        # --- LAYER 2: ENRICHMENT (concurrent, stateless) ---
+        future = executor.submit(enricher.process_batch, batch, userdata['db_connector'])
+        enriched_queue.put((len(batch), future))
+
+    enriched_queue.put(None)
+
+def event_worker(userdata):
+    """
+    Takes enriched batches in arrival order and runs each event through L3 and L4.
+    The digital twins and baseline rules are stateful, so this stage stays on one thread.
+    """
+    enriched_queue = userdata['enriched_queue']
+    db_connector = userdata['db_connector']
+
+    while True:
+        try:
+            item = enriched_queue.get(timeout=EVENT_FLUSH_IDLE_SECS)
+        except queue.Empty:
+            # Nothing arriving; write out whatever the last burst left in the event buffer
+            db_connector.flush_events()
+            continue
+        if item is None:
+            break
+
+        batch_size, future = item
+        try:
+            enriched_events = future.result()
+        except Exception as e:
+            log.error("❌ An unexpected error occurred while enriching a batch: %s", e)
+            continue
+
+        skipped = batch_size - len(enriched_events)
+        if skipped:
+            log.debug("   -> Stop ⚠️ %d event(s) could not be enriched (Skipped by L2).", skipped)
+
+        for enriched_event in enriched_events:
+            try:
+                handle_event(enriched_event, userdata)
+            except Exception as e:
+                log.error("❌ An unexpected error occurred while handling an event: %s", e)
+
+def count_dt_update(label, dt):
+    """Steady-state DT observer: counts the update without snapshotting the twin."""
+    DT_UPDATE_COUNTERS[label].inc()
+
+def handle_event(enriched_event, userdata):
+    """Runs a single enriched event through Layer 3 and the Layer 4 pipeline."""
     db_connector = userdata['db_connector']
     hospital_dt_manager = userdata['hospital_dt_manager']
     detector = userdata['detector']
     contextualizer = userdata['contextualizer']
     packager = userdata['packager']
-    
-    enriched_event = None
 
-    # --- LAYER 2: ENRICHMENT ---
-    if msg.topic == userdata['device_topic']:
-        enriched_event = enricher.process_device_message(payload, db_connector)
-    elif msg.topic == userdata['network_topic']:
-        enriched_event = enricher.process_network_message(payload, db_connector)
-    
-    if not enriched_event:
-        print("   -> Stop ⚠️ Event could not be enriched (Skipped by L2).")
-        return
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("   -> L2 (Enriched): %s", json_utils.dumps(enriched_event))
 
     # --- LAYER 3: INFORMATION (Digital Twin Update) ---
-    updated_states = hospital_dt_manager.update_from_event(enriched_event)
+    # DT snapshots are only taken (and serialized) when they will actually be logged
+    if log.isEnabledFor(logging.DEBUG):
+        updated_states = hospital_dt_manager.update_and_snapshot(enriched_event)
+        for label, state in updated_states:
+            DT_UPDATE_COUNTERS[label].inc()
+            log.debug("   -> L3 (Living Profile): %s updated: %s", label, json_utils.dumps(state._asdict()))
+        if not updated_states:
+            log.debug("   -> L3 (Living Profile): No DTs updated for this event.")
+    else:
+        hospital_dt_manager.update_from_event(enriched_event, count_dt_update)
     
     storage_success = db_connector.store_event(enriched_event)
-    print(f"   -> L3 (Historical): Event storage success: {storage_success}")
-
-    if updated_states:
-        print(f"   -> L3 (Living Profile): {len(updated_states)} DT(s) updated.")
-    else:
-        print("   -> L3 (Living Profile): No DTs updated for this event.")
+    log.debug("   -> L3 (Historical): Event buffered for storage: %s", storage_success)
             
     # ---
     # --- LAYER 4 PIPELINE ---
@@ -72,10 +226,10 @@ def on_message(client, userdata, msg):
     triggered_anomalies = detector.check_event(enriched_event, hospital_dt_manager)
     
     if not triggered_anomalies:
-        print("   -> L4 (Detect): No anomalies detected. Event is benign. ✅")
+        log.debug("   -> L4 (Detect): No anomalies detected. Event is benign. ✅")
         return
         
-    print(f"   -> L4 (Detect): ⚠️ {len(triggered_anomalies)} anomalies flagged: {triggered_anomalies}")
+    log.info("   -> L4 (Detect): ⚠️ %d anomalies flagged: %s", len(triggered_anomalies), triggered_anomalies)
     
     # Step 2: Consistency Check
     suspicious_anomalies = contextualizer.filter_anomalies(
@@ -83,34 +237,35 @@ def on_message(client, userdata, msg):
     )
     
     if not suspicious_anomalies:
-        print("   -> L4 (Context): Anomalies explained as benign. ✅")
+        log.info("   -> L4 (Context): Anomalies explained as benign. ✅")
         return
 
-    print(f"   -> L4 (Context): 🚨 {len(suspicious_anomalies)} suspicious anomalies confirmed: {suspicious_anomalies}")
+    log.info("   -> L4 (Context): 🚨 %d suspicious anomalies confirmed: %s", len(suspicious_anomalies), suspicious_anomalies)
 
     # Step 3: Package Creation
     case_file_json = packager.build_case_file(
         suspicious_anomalies, enriched_event, hospital_dt_manager
     )
     
-    print("   -> L4 (Package): 🚀 Case file built. Escalating to Layer 5 (LLM)...")
+    log.info("   -> L4 (Package): 🚀 Case file built. Escalating to Layer 5 (LLM)...")
     
     # --- This is where you would send to Layer 5 ---
-    print("\n" + "="*60)
-    print(f"--- 🚨 SUSPICIOUS EVENT CASE FILE 🚨 ---")
-    print(case_file_json)
-    print("="*60 + "\n")
+    log.warning("--- 🚨 SUSPICIOUS EVENT CASE FILE 🚨 ---\n%s", case_file_json)
     
 
 def main():
     """Main function to start the L2, L3, and L4 processing service."""
-    print("--- Starting Layer 2/3/4: Data Processing Service ---") 
+    config = load_config()
+    configure_logging(config.get('LOGGING', {}).get('LEVEL', 'INFO'))
+    log.info("--- Starting Layer 2/3/4: Data Processing Service ---")
+    pin_to_cpus(config.get('PROCESS', {}).get('CPU_AFFINITY', ''))
     
-    config = configparser.ConfigParser()
-    config.read('config.ini')
     mqtt_config = config['MQTT']
+    if 'METRICS' in config:
+        metrics.serve(config['METRICS']['PORT'])
 
-    db_connector = DatabaseConnector()
+    # One read connection per enrichment worker; the event worker's flushes use the separate write pool
+    db_connector = DatabaseConnector(max_connections=ENRICH_WORKERS)
     hospital_dt_manager = HospitalDT()
     detector = AnomalyDetector()
     contextualizer = ConsistencyChecker()
@@ -122,6 +277,12 @@ def main():
         "detector": detector,
         "contextualizer": contextualizer,
         "packager": packager,
+        "ingest_queue": queue.Queue(maxsize=INGEST_QUEUE_MAX),
+        "dropped_messages": 0,
+        "stop_event": threading.Event(),
+        # Bounded so the batch worker can't run far ahead of the event worker
+        "enriched_queue": queue.Queue(maxsize=ENRICH_WORKERS * 2),
+        "executor": ThreadPoolExecutor(max_workers=ENRICH_WORKERS, thread_name_prefix="enrich"),
         "device_topic": mqtt_config['DEVICE_TOPIC'],
         "network_topic": mqtt_config['NETWORK_TOPIC'] 
     }
@@ -131,24 +292,48 @@ def main():
 
     client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, userdata=user_data)
     client.on_connect = on_connect
-    client.on_message = on_message
+    # Messages on any other topic fall through to the (unset) on_message and are ignored
+    topic_event_types = {
+        user_data['device_topic']: enricher.DEVICE_EVENT,
+        user_data['network_topic']: enricher.NETWORK_EVENT,
+    }
+    for topic, event_type in topic_event_types.items():
+        client.message_callback_add(topic, make_message_callback(event_type, user_data['ingest_queue']))
+
+    workers = [
+        threading.Thread(target=batch_worker, args=(user_data,), name="batch-worker", daemon=True),
+        threading.Thread(target=event_worker, args=(user_data,), name="event-worker", daemon=True),
+    ]
+    for worker in workers:
+        worker.start()
 
     try:
-        print("🔌 Attempting to connect to MQTT broker...")
-        client.connect(mqtt_config['BROKER_ADDRESS'], int(mqtt_config['PORT']), 60)
-        print("👂 Listening for messages... Press Ctrl+C to stop.")
-        client.loop_forever()
+        log.info("🔌 Attempting to connect to MQTT broker...")
+        client.connect(mqtt_config['BROKER_ADDRESS'], mqtt_config['PORT'], 60)
+        log.info("👂 Listening for messages... Press Ctrl+C to stop.")
+        # paho reads the socket on its own thread; the main thread just waits to be stopped
+        client.loop_start()
+        while not user_data['stop_event'].wait(1):
+            pass
     except ConnectionRefusedError:
-        print(f"❌ MQTT Connection Error: Connection was refused.")
+        log.error("❌ MQTT Connection Error: Connection was refused.")
     except KeyboardInterrupt:
-        print("\n\n🛑 Service stopped by user.")
+        log.info("\n\n🛑 Service stopped by user.")
     except Exception as e:
-        print(f"❌ An unexpected error occurred: {e}")
+        log.error("❌ An unexpected error occurred: %s", e)
     finally:
-        print("   Disconnecting MQTT client and closing database connection...")
+        log.info("   Disconnecting MQTT client and closing database connection...")
         client.disconnect()
+        client.loop_stop()
+        if user_data['dropped_messages']:
+            log.warning("⚠️ %d message(s) were dropped because the ingest queue was full.", user_data['dropped_messages'])
+        # Let the workers finish whatever is already queued before the DB goes away
+        user_data['ingest_queue'].put(None)
+        for worker in workers:
+            worker.join()
+        user_data['executor'].shutdown()
         db_connector.close()
-        print("--- Layer 2/3/4 Service Shut Down ---") 
+        log.info("--- Layer 2/3/4 Service Shut Down ---")
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
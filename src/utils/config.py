@@ -0,0 +1,26 @@
+import configparser
+from functools import lru_cache
+from types import MappingProxyType
+
+# Keys whose values are converted to int when the file is loaded
+INT_KEYS = ('PORT',)
+
+
+@lru_cache(maxsize=None)
+def load_config(path='config.ini'):
+    """
+    Parses `path` once and returns a read-only {section: {KEY: value}} mapping.
+    Keys are upper-cased to match config.ini (configparser lower-cases them),
+    and INT_KEYS are already ints. Later calls return the same cached mapping.
+    """
+    parser = configparser.ConfigParser()
+    parser.read(path)
+
+    sections = {}
+    for section in parser.sections():
+        values = {key.upper(): value for key, value in parser[section].items()}
+        for key in INT_KEYS:
+            if key in values:
+                values[key] = int(values[key])
+        sections[section] = MappingProxyType(values)
+    return MappingProxyType(sections)
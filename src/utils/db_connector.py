@@ -1,99 +1,460 @@
 import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
 import psycopg2.extras
-import configparser
+import psycopg2.pool
+import hashlib
+import itertools
+import logging
+import re
 import sys
-import json
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from src.utils import json_utils, metrics
+from src.utils.config import load_config
+
+# --- CONNECTION POOL SIZE ---
+POOL_MIN_CONNECTIONS = 2  # Read connections opened up front, so the first batches don't pay for a connect
+POOL_MAX_CONNECTIONS = 10
+WRITE_POOL_MAX_CONNECTIONS = 2  # event_logs flushes come from the event worker (and close())
+
+# --- TCP KEEPALIVES ---
+# Detect a dead server or a dropped NAT/firewall mapping on idle pooled connections
+KEEPALIVES_IDLE_SECS = 30
+KEEPALIVES_INTERVAL_SECS = 10
+KEEPALIVES_COUNT = 3
+
+# --- EVENT LOG WRITE BUFFER ---
+EVENT_BATCH_SIZE = 500   # Flush once this many events are buffered...
+EVENT_FLUSH_SECS = 0.1   # ...or this long after the previous flush
+EVENT_BUFFER_MAX = 50_000  # Rows kept while the database is unreachable; the oldest are dropped beyond this
+EVENT_RETRY_SECS = 1.0     # After a connection failure, wait this long before store_event flushes again
+
+# Errors caused by the rows themselves (bad values, no partition, unserializable data) vs. by the connection
+_ROW_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError, TypeError, ValueError)
+_CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, psycopg2.pool.PoolError)
+
+# --- PREPARED STATEMENTS ---
+PREPARED_MAX_PER_CONNECTION = 256  # Least recently used statements beyond this are DEALLOCATEd
+
+# --- EVENT LOG PARTITIONS ---
+# event_logs is partitioned by UTC day; a flush creates the partitions its rows need, but only
+# for days near today so that arbitrary event timestamps can't create unbounded tables
+PARTITION_PAST_DAYS = 7    # Oldest day (before today, UTC) that still gets its own partition
+PARTITION_FUTURE_DAYS = 1  # Newest day (after today, UTC); rows outside the window go to event_logs_default
+PARTITION_DDL = """
+    CREATE TABLE IF NOT EXISTS event_logs_{day:%Y%m%d} PARTITION OF event_logs
+    FOR VALUES FROM ('{day:%Y-%m-%d} 00:00:00+00') TO ('{next_day:%Y-%m-%d} 00:00:00+00')
+"""
+
+# Every buffered row goes into one statement: each column is passed as a single text[] parameter
+INSERT_EVENTS_QUERY = """
+    INSERT INTO event_logs (event_type, timestamp, event_data)
+    SELECT event_type, timestamp::timestamptz, event_data::jsonb
+    FROM unnest(%s::text[], %s::text[], %s::text[]) AS batch(event_type, timestamp, event_data)
+"""
+
+log = logging.getLogger(__name__)
+
+_PLACEHOLDER_RE = re.compile(r'%s')
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """
+    A psycopg2 connection that remembers which queries it has PREPAREd
+    (query text -> name), least recently used first, and keeps one reusable
+    cursor of each kind instead of opening a new one per call.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = OrderedDict()
+        self._dict_cur = None
+        self._plain_cur = None
+
+    def dict_cursor(self):
+        """Returns this connection's RealDictCursor, opening it on first use."""
+        if self._dict_cur is None or self._dict_cur.closed:
+            self._dict_cur = self.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        return self._dict_cur
+
+    def plain_cursor(self):
+        """Returns this connection's tuple cursor, opening it on first use."""
+        if self._plain_cur is None or self._plain_cur.closed:
+            self._plain_cur = self.cursor()
+        return self._plain_cur
+
+    def close(self):
+        """Closes the reusable cursors along with the connection."""
+        for cur in (self._dict_cur, self._plain_cur):
+            if cur is not None and not cur.closed:
+                cur.close()
+        super().close()
+
+def _statement_name(query):
+    """Derives a stable prepared-statement name from the query text."""
+    return f"stmt_{hashlib.blake2b(query.encode('utf-8'), digest_size=8).hexdigest()}"
+
+def _parse_timestamp(timestamp):
+    """
+    Parses an ISO-8601 event timestamp into a UTC datetime, or returns None if it
+    isn't one. Naive timestamps are taken as UTC, matching the write connections' TimeZone.
+    """
+    try:
+        moment = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+def _event_days(timestamps):
+    """Returns the UTC dates of the given ISO-8601 timestamps, skipping unparsable ones."""
+    return {moment.date() for moment in map(_parse_timestamp, timestamps) if moment is not None}
+
+def _to_positional(query):
+    """Rewrites psycopg2's %s placeholders into PREPARE's $1, $2, ... parameters."""
+    counter = itertools.count(1)
+    return _PLACEHOLDER_RE.sub(lambda _: f"${next(counter)}", query)
 
 class DatabaseConnector:
     """A dedicated class to handle all PostgreSQL database interactions."""
     
-    def __init__(self, config_path='config.ini'):
-        """Initializes the connector and establishes a database connection."""
-        self.conn = None
+    def __init__(self, config_path='config.ini', max_connections=POOL_MAX_CONNECTIONS):
+        """
+        Initializes the connector and establishes two thread-safe connection pools:
+        autocommit, read-only connections for lookups and transactional ones for
+        event_logs writes. `max_connections` sizes the read pool and must cover
+        every thread that runs lookups at once.
+        """
+        self._read_pool = None
+        self._write_pool = None
+        self._event_buffer = []
+        self._buffer_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._retry_at = 0.0  # store_event doesn't trigger flushes before this (monotonic) time
+        self._partitioned = True     # Cleared if event_logs turns out to be a plain table
+        self._partition_days = set() # Days whose event_logs partition is known to exist
+        self._sync_commit = None     # synchronous_commit for event_logs flushes; None keeps the server default
         try:
-            config = configparser.ConfigParser()
-            config.read(config_path)
+            postgres_config = load_config(config_path)['POSTGRES']
+            self._sync_commit = postgres_config.get('SYNC_COMMIT')
             
-            self.conn = psycopg2.connect(
-                host=config['POSTGRES']['HOST'],
-                port=config['POSTGRES']['PORT'],
-                dbname=config['POSTGRES']['DATABASE'],
-                user=config['POSTGRES']['USER'],
-                password=config['POSTGRES']['PASSWORD']
+            connect_kwargs = dict(
+                host=postgres_config['HOST'],
+                port=postgres_config['PORT'],
+                dbname=postgres_config['DATABASE'],
+                user=postgres_config['USER'],
+                password=postgres_config['PASSWORD'],
+                keepalives=1,
+                keepalives_idle=KEEPALIVES_IDLE_SECS,
+                keepalives_interval=KEEPALIVES_INTERVAL_SECS,
+                keepalives_count=KEEPALIVES_COUNT,
+                connection_factory=PreparingConnection
+            )
+            self._read_pool = psycopg2.pool.ThreadedConnectionPool(
+                POOL_MIN_CONNECTIONS, max_connections, **connect_kwargs
+            )
+            # UTC sessions, so naive timestamps are cast to the same day _event_days() picks
+            self._write_pool = psycopg2.pool.ThreadedConnectionPool(
+                1, WRITE_POOL_MAX_CONNECTIONS, options='-c TimeZone=UTC', **connect_kwargs
             )
-            print("✅ Database connection established successfully.")
+            log.info("✅ Database connection pools established successfully.")
         except psycopg2.OperationalError as e:
-            print(f"❌ Critical Error: Could not connect to the database.")
-            print(f"   Please ensure the PostgreSQL service is running and accessible.")
-            print(f"   Error details: {e}")
+            log.critical("❌ Critical Error: Could not connect to the database.")
+            log.critical("   Please ensure the PostgreSQL service is running and accessible.")
+            log.critical("   Error details: %s", e)
             sys.exit(1)
         except Exception as e:
-            print(f"❌ An unexpected error occurred during DB connection: {e}")
+            log.critical("❌ An unexpected error occurred during DB connection: %s", e)
             sys.exit(1)
 
+    @contextmanager
+    def _conn(self, read_only=False):
+        """
+        Checks a connection out of the read or write pool for the duration of a with-block.
+        Read connections are switched to autocommit + read-only on first use, so lookups
+        never open a transaction. For write connections, the pool rolls back any
+        transaction still open when it takes the connection back.
+        A connection that dropped (e.g. the server restarted) is discarded instead of
+        returned, so the next checkout opens a fresh one.
+        """
+        pool = self._read_pool if read_only else self._write_pool
+        conn = pool.getconn()
+        broken = False
+        try:
+            if read_only and not conn.autocommit:
+                conn.set_session(readonly=True, autocommit=True)
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            pool.putconn(conn, close=broken or bool(conn.closed))
+
+    def _execute_prepared(self, conn, cur, query, params=None):
+        """
+        Executes `query` as a server-side prepared statement, PREPAREing it the
+        first time this connection sees it so later calls skip parse and plan.
+        Each connection keeps at most PREPARED_MAX_PER_CONNECTION statements.
+        Must not follow uncommitted writes in its transaction, since a stale
+        statement is recovered by rolling back and preparing it again.
+        Queries using %(name)s placeholders, dict params or %% escapes only work
+        with psycopg2's own formatting, so they run unprepared.
+        """
+        if isinstance(params, Mapping) or '%(' in query or '%%' in query:
+            cur.execute(query, params)
+            return
+
+        name = conn.prepared.get(query)
+        if name is None:
+            if len(conn.prepared) >= PREPARED_MAX_PER_CONNECTION:
+                _, evicted = conn.prepared.popitem(last=False)
+                cur.execute(f"DEALLOCATE {evicted}")
+            name = _statement_name(query)
+            cur.execute(f"PREPARE {name} AS {_to_positional(query)}")
+            conn.prepared[query] = name
+        else:
+            conn.prepared.move_to_end(query)
+
+        try:
+            self._execute_statement(cur, name, params)
+        except (psycopg2.errors.FeatureNotSupported, psycopg2.errors.InvalidSqlStatementName) as e:
+            # The cached plan no longer matches the table (e.g. after a reseed), or the
+            # statement is gone from the session: prepare it again and retry once
+            conn.rollback()
+            if isinstance(e, psycopg2.errors.FeatureNotSupported):
+                cur.execute(f"DEALLOCATE {name}")
+            cur.execute(f"PREPARE {name} AS {_to_positional(query)}")
+            self._execute_statement(cur, name, params)
+
+    def _execute_statement(self, cur, name, params):
+        """Runs EXECUTE for an already prepared statement."""
+        if params:
+            cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cur.execute(f"EXECUTE {name}")
+
     def fetch_one_as_dict(self, query, params=None):
-        """Executes a query and returns a single result as a dictionary."""
-        if not self.conn:
-            print("⚠️ Cannot fetch data, no database connection.")
+        """
+        Executes a query and returns a single result as a dictionary.
+        Like every lookup, it runs as a per-connection prepared statement.
+        """
+        if not self._read_pool:
+            log.warning("⚠️ Cannot fetch data, no database connection.")
             return None
             
         try:
             # Use a RealDictCursor to get results as dictionaries
-            with self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                cur.execute(query, params)
+            with metrics.DB_LOOKUP_SECONDS.time(), self._conn(read_only=True) as conn:
+                cur = conn.dict_cursor()
+                self._execute_prepared(conn, cur, query, params)
                 return cur.fetchone()
-        except (psycopg2.DatabaseError) as e:
-            print(f"❌ Database query failed: {e}")
+        except (psycopg2.DatabaseError, psycopg2.pool.PoolError) as e:
+            log.error("❌ Database query failed: %s", e)
             # In a real app, you might want to try reconnecting here
-            self.conn.rollback() 
             return None
 
-    def store_event(self, event_data):
-        """Stores an enriched event in the event_logs table."""
-        if not self.conn:
-            print("⚠️ Cannot store event, no database connection.")
-            return False
+    def fetch_all_as_dict(self, query, params=None):
+        """
+        Executes a query and returns all result rows as a list of dictionaries.
+        Returns None (rather than an empty list) if the query could not be run.
+        """
+        if not self._read_pool:
+            log.warning("⚠️ Cannot fetch data, no database connection.")
+            return None
             
         try:
-            # Extract data for indexed columns
-            event_type = event_data.get('eventType')
-            timestamp = event_data.get('timestamp')
-            
-            # Convert event_data dict to a JSON string for insertion
-            event_json = json.dumps(event_data)
+            with metrics.DB_LOOKUP_SECONDS.time(), self._conn(read_only=True) as conn:
+                cur = conn.dict_cursor()
+                self._execute_prepared(conn, cur, query, params)
+                return cur.fetchall()
+        except (psycopg2.DatabaseError, psycopg2.pool.PoolError) as e:
+            log.error("❌ Database query failed: %s", e)
+            return None
+
+    def store_event(self, event_data):
+        """
+        Buffers an enriched event for the event_logs table. The buffer is written
+        with a single multi-row INSERT once it holds EVENT_BATCH_SIZE events or
+        EVENT_FLUSH_SECS have passed since the last flush.
+        The event is serialized at flush time, so it must not be modified after this call.
+        Returns False if the event (or a flush it triggered) could not be stored;
+        events whose timestamp isn't ISO-8601 are never buffered.
+        """
+        if not self._write_pool:
+            log.warning("⚠️ Cannot store event, no database connection.")
+            return False
             
-            query = """
-                INSERT INTO event_logs (event_type, timestamp, event_data)
-                VALUES (%s, %s, %s)
-            """
-            with self.conn.cursor() as cur:
-                cur.execute(query, (event_type, timestamp, event_json))
-            self.conn.commit()
+        # Extract data for indexed columns
+        event_type = event_data.get('eventType')
+        timestamp = event_data.get('timestamp')
+
+        # event_logs.timestamp is a timestamptz; one unparsable value would fail the whole batch
+        if _parse_timestamp(timestamp) is None:
+            log.warning("⚠️ Not storing %s event with invalid timestamp '%s'", event_type, timestamp)
+            return False
+        
+        # Json defers serialization (orjson when installed) to the flush, when psycopg2 adapts the batch
+        event_payload = psycopg2.extras.Json(event_data, dumps=json_utils.dumps)
+
+        with self._buffer_lock:
+            self._event_buffer.append((event_type, timestamp, event_payload))
+            now = time.monotonic()
+            flush_due = now >= self._retry_at and (len(self._event_buffer) >= EVENT_BATCH_SIZE or
+                                                   now - self._last_flush >= EVENT_FLUSH_SECS)
+
+        if flush_due:
+            return self.flush_events()
+        return True
+
+    def _ensure_partitions(self, conn, timestamps):
+        """
+        Creates the daily event_logs partitions that `timestamps` fall into, skipping
+        days already handled by this connector and days outside the PARTITION_PAST_DAYS /
+        PARTITION_FUTURE_DAYS window around today (their rows land in the DEFAULT partition).
+        Each day is committed on its own.
+        """
+        if not self._partitioned:
+            return
+        today = datetime.now(timezone.utc).date()
+        first_day = today - timedelta(days=PARTITION_PAST_DAYS)
+        last_day = today + timedelta(days=PARTITION_FUTURE_DAYS)
+        # Forget days that have left the window, so the set stays bounded too
+        self._partition_days = {day for day in self._partition_days if day >= first_day}
+        cur = conn.plain_cursor()
+        new_days = {day for day in _event_days(timestamps) if first_day <= day <= last_day}
+        for day in sorted(new_days - self._partition_days):
+            try:
+                cur.execute(PARTITION_DDL.format(day=day, next_day=day + timedelta(days=1)))
+                conn.commit()
+            except psycopg2.errors.WrongObjectType:
+                # event_logs was created unpartitioned (an older seed); insert into it directly
+                conn.rollback()
+                self._partitioned = False
+                log.warning("⚠️ event_logs is not partitioned; skipping partition management.")
+                return
+            except psycopg2.errors.InvalidObjectDefinition:
+                conn.rollback()  # Another partition already covers this day
+            except psycopg2.errors.CheckViolation:
+                # The DEFAULT partition already holds rows for this day; keep routing them there
+                conn.rollback()
+                log.warning("⚠️ event_logs_default has rows for %s; not creating a partition for that day.", day)
+            self._partition_days.add(day)
+
+    def _insert_rows(self, conn, rows):
+        """Writes `rows` with one prepared INSERT and commits it."""
+        # Transpose the rows into one list per column (lists adapt to arrays; tuples wouldn't)
+        columns = [list(column) for column in zip(*rows)]
+        cur = conn.plain_cursor()
+        if self._sync_commit:
+            # SET LOCAL: applies to this flush transaction only
+            cur.execute("SET LOCAL synchronous_commit = %s", (self._sync_commit,))
+        self._execute_prepared(conn, cur, INSERT_EVENTS_QUERY, columns)
+        conn.commit()
+
+    def _requeue(self, rows):
+        """Puts unwritten rows back at the front of the buffer, keeping at most EVENT_BUFFER_MAX rows."""
+        with self._buffer_lock:
+            self._event_buffer[:0] = rows
+            overflow = len(self._event_buffer) - EVENT_BUFFER_MAX
+            if overflow > 0:
+                del self._event_buffer[:overflow]
+        if overflow > 0:
+            log.error("❌ Event buffer full; dropped the %d oldest unwritten event(s).", overflow)
+
+    def flush_events(self):
+        """
+        Writes every buffered event with one prepared INSERT and one commit.
+        With POSTGRES.SYNC_COMMIT = off, that commit doesn't wait for the WAL fsync.
+        If a row makes the batch fail, the batch is retried row by row so only the
+        bad rows are dropped; if the connection fails, the unwritten rows go back
+        into the buffer for the next flush.
+        Returns True if every row was stored.
+        """
+        with self._buffer_lock:
+            rows, self._event_buffer = self._event_buffer, []
+            self._last_flush = time.monotonic()
+
+        if not rows:
             return True
-            
-        except (psycopg2.DatabaseError) as e:
-            print(f"❌ Database insert failed for event: {e}")
-            self.conn.rollback() 
+
+        stored = rejected = 0
+        try:
+            with metrics.DB_WRITE_SECONDS.time(), self._conn() as conn:
+                self._ensure_partitions(conn, [row[1] for row in rows])
+                try:
+                    self._insert_rows(conn, rows)
+                    stored = len(rows)
+                except _ROW_ERRORS as e:
+                    conn.rollback()
+                    log.warning("⚠️ Batch insert of %d event(s) failed (%s); retrying them one by one.", len(rows), e)
+                    for row in rows:
+                        try:
+                            self._insert_rows(conn, [row])
+                            stored += 1
+                        except _ROW_ERRORS as e:
+                            conn.rollback()
+                            rejected += 1
+                            log.error("❌ Dropping event that could not be stored (%s at %s): %s", row[0], row[1], e)
+        except _CONNECTION_ERRORS as e:
+            unwritten = rows[stored + rejected:]
+            self._requeue(unwritten)
+            self._retry_at = time.monotonic() + EVENT_RETRY_SECS
+            log.error("❌ Database unavailable; %d event(s) kept for the next flush: %s", len(unwritten), e)
             return False
-        except Exception as e:
-            print(f"❌ An error occurred during event storage: {e}")
+        except psycopg2.DatabaseError as e:
+            self._partition_days.clear()  # Re-check partitions next time (e.g. the table was recreated)
+            log.error("❌ Database insert failed for %d buffered event(s): %s", len(rows) - stored - rejected, e)
             return False
+        finally:
+            metrics.EVENTS_STORED.inc(stored)
+
+        return rejected == 0
 
     def close(self):
-        """Closes the database connection."""
-        if self.conn:
-            self.conn.close()
-            print("🔌 Database connection closed.")
+        """Flushes any buffered events, then closes every pooled database connection."""
+        if self._write_pool:
+            self.flush_events()
+            self._write_pool.closeall()
+        if self._read_pool:
+            self._read_pool.closeall()
+        log.info("🔌 Database connection pools closed.")
 
 
 # A small, focused class DatabaseConnector that centralizes PostgreSQL connection management and basic querying.
 
-# Reads DB connection settings from a config.ini file using configparser.
+# Reads DB connection settings from config.ini through the shared, parse-once load_config() helper.
 
-# Establishes a psycopg2 connection in __init__, printing success or exiting on failure.
+# Opens two thread-safe psycopg2 ThreadedConnectionPools in __init__, logging success or exiting on failure:
+# autocommit, read-only connections for lookups (no BEGIN/ROLLBACK round trips) and transactional ones for event_logs writes.
+# Each call checks a connection out of the matching pool, so several worker threads can query at once.
 
 # Provides fetch_one_as_dict(query, params) to run a query and return a single row as a Python dict (via RealDictCursor).
 
-# Handles DB errors by printing an error, rolling back the transaction, and returning None.
+# Provides fetch_all_as_dict(query, params) to run a query and return every row as a list of dicts (used for batched lookups).
+
+# Each pooled connection keeps one RealDictCursor and one plain cursor for reuse; they close with the connection.
+
+# Runs every lookup and the event INSERT as server-side prepared statements, PREPAREd once per pooled connection and EXECUTEd
+# afterwards (re-prepared if a cached plan goes stale); each connection keeps an LRU of at most 256, DEALLOCATing the rest.
+
+# Buffers events in store_event(event) and writes them with one array-parameter INSERT per flush (by size or age), cutting commits from N to N/batch;
+# flush_events() forces a write and close() flushes before shutting down; config.ini's POSTGRES.SYNC_COMMIT sets
+# synchronous_commit for those flush transactions only.
+
+# Creates the daily event_logs partitions (PARTITION BY RANGE on timestamp, see scripts/seed_database.py) on demand
+# before each flush, remembering which days already exist; write connections use TimeZone=UTC so days match.
+# Only days from PARTITION_PAST_DAYS before to PARTITION_FUTURE_DAYS after today get a partition; the rest go to DEFAULT.
+
+# A batch that fails on a bad row is retried row by row, and rows that hit a connection error are kept in the buffer
+# (up to EVENT_BUFFER_MAX) for the next flush instead of being dropped.
+# Events whose timestamp isn't ISO-8601 are logged and never buffered; they still go through L3/L4 in main.
+
+# Handles DB errors by logging an error and returning None; the write pool rolls back a failed transaction,
+# and connections lost to a transient disconnect are closed and replaced rather than reused.
 
-# Exposes close() to cleanly close the DB connection.
\ No newline at end of file
+# Exposes close() to cleanly close every pooled DB connection.
\ No newline at end of file
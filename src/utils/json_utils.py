@@ -0,0 +1,21 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the standard library
+    orjson = None
+
+
+def dumps(obj, indent=False):
+    """
+    Serializes obj to a JSON string, using orjson when it is installed.
+    Values JSON can't represent natively, datetimes included, are converted
+    with str(), and both paths produce the same text; indent=True pretty-prints
+    with two spaces (used for case files).
+    """
+    if orjson is not None:
+        option = orjson.OPT_PASSTHROUGH_DATETIME | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, default=str, option=option).decode('utf-8')
+    if indent:
+        return json.dumps(obj, default=str, indent=2, ensure_ascii=False)
+    return json.dumps(obj, default=str, separators=(',', ':'), ensure_ascii=False)
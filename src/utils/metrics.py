@@ -0,0 +1,55 @@
+import logging
+from contextlib import nullcontext
+
+try:
+    import prometheus_client
+except ImportError:  # prometheus_client is optional; metrics become no-ops without it
+    prometheus_client = None
+
+log = logging.getLogger(__name__)
+
+
+class _NoopMetric:
+    """Stands in for a Counter/Histogram when prometheus_client is not installed."""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def observe(self, value):
+        pass
+
+    def time(self):
+        return nullcontext()
+
+
+def _counter(name, documentation, labelnames=()):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return prometheus_client.Counter(name, documentation, labelnames)
+
+
+def _histogram(name, documentation):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return prometheus_client.Histogram(name, documentation)
+
+
+# --- PIPELINE METRICS ---
+MESSAGES_RECEIVED = _counter('mqtt_messages_total', 'MQTT messages received', ['event_type'])
+MESSAGES_DROPPED = _counter('mqtt_messages_dropped_total', 'MQTT messages dropped because the ingest queue was full')
+EVENTS_STORED = _counter('events_stored_total', 'Events written to event_logs')
+DT_UPDATES = _counter('dt_updates_total', 'Digital twin updates', ['twin'])
+DB_LOOKUP_SECONDS = _histogram('db_lookup_seconds', 'Time spent running an enrichment lookup query')
+DB_WRITE_SECONDS = _histogram('db_write_seconds', 'Time spent writing one buffered batch to event_logs')
+
+
+def serve(port):
+    """Exposes the metrics over HTTP on `port`; does nothing if prometheus_client is missing."""
+    if prometheus_client is None:
+        log.info("ℹ️ prometheus_client not installed; metrics are disabled.")
+        return
+    prometheus_client.start_http_server(port)
+    log.info("📈 Serving metrics on port %d", port)